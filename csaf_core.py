@@ -0,0 +1,155 @@
+# csaf_core.py
+"""Gedeelde notify-logica voor notify_ncsc.py en scraper.py."""
+import os
+import csv
+import html
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dedupe import USER_AGENT
+
+# ---------------------------------------------------------------------
+# Config
+# ---------------------------------------------------------------------
+OUTPUT_DIR = Path("output/daily")
+
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_CHAT_ID   = os.getenv("TELEGRAM_CHAT_ID")
+
+# Eén Session voor de Telegram API: keep-alive + alleen veilige retries.
+# sendMessage is een niet-idempotente POST: na een 5xx of read-timeout kan Telegram
+# het bericht al geaccepteerd hebben, dus alleen 429 (met Retry-After) en connect-fouten.
+TELEGRAM_SESSION = requests.Session()
+TELEGRAM_SESSION.headers.update({"User-Agent": USER_AGENT})
+TELEGRAM_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=2,
+        max_retries=Retry(
+            total=3,
+            read=0,
+            other=0,
+            backoff_factor=0.5,
+            status_forcelist=[429],
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Exacte severity-tags (genormaliseerd: upper, zonder []); SEV_RE alleen voor vrije tekst
+SEV_SET = frozenset({"H/H", "M/H", "H/M", "HIGH/HIGH", "MED/HIGH", "HIGH/MED"})
+SEV_RE = re.compile(r"(\[?(H/H|M/H|H/M)\]?|High/High|Med/High|High/Med)", re.IGNORECASE)
+
+# Eén regel per advisory in het Telegram-bericht (velden komen uit normalize_row)
+LINE_TMPL = "• <b>[{Severity}]</b> — {Description}"
+LINE_TMPL_LINK = LINE_TMPL + "\n  🔗 <a href='{Link}'>Bekijk advisory</a>"
+URGENT_HEADER = "🚨😡 <b>URGENT</b>\n\nDetails:\n"
+
+# Telegram staat 4096 tekens toe; ruim eronder blijven
+MESSAGE_MAX_BYTES = 3900
+
+# ---------------------------------------------------------------------
+def log(msg: str) -> None:
+    print(msg, flush=True)
+
+@lru_cache(maxsize=1)
+def latest_csv() -> Path | None:
+    # één scandir-pass; bestandsnamen zijn YYYY-MM-DD.csv, dus de grootste naam is de nieuwste dag
+    # (mtime is onbetrouwbaar: na een git checkout hebben alle bestanden dezelfde)
+    try:
+        with os.scandir(OUTPUT_DIR) as entries:
+            name = max((e.name for e in entries if e.name.endswith(".csv") and e.is_file()), default=None)
+    except FileNotFoundError:
+        return None
+    return OUTPUT_DIR / name if name else None
+
+def is_high_risk(severity: str) -> bool:
+    sev = severity.strip()
+    if not sev:
+        return False
+    if sev.upper().strip("[]") in SEV_SET:
+        return True
+    return SEV_RE.search(sev) is not None
+
+def _btrunc(text: str, nbytes: int) -> str:
+    """Truncate to at most nbytes of UTF-8 without splitting a character."""
+    data = text.encode("utf-8")
+    if len(data) <= nbytes:
+        return text
+    return data[:nbytes].decode("utf-8", "ignore")
+
+def normalize_row(r: Dict[str, str]) -> Dict[str, str]:
+    """
+    Return the message fields of a row with the column fallbacks resolved.
+    Nieuwe dict: de CSV-rij zelf blijft ongewijzigd, zodat dedupe.advisory_key
+    (hash over o.a. Description) dezelfde sleutel blijft geven.
+    Waarden worden HTML-escaped (parse_mode=HTML); eerst inkorten, dan escapen,
+    zodat er nooit een half entity in het bericht belandt.
+    """
+    desc = r.get("Description") or r.get("Title") or r.get("Naam") or r.get("Name") or "Onbekende melding"
+    short = _btrunc(desc, 300)
+    if short != desc:
+        desc = short.rstrip() + "…"
+    return {
+        "Severity": html.escape(r.get("Severity") or "?", quote=False),
+        "Description": html.escape(desc, quote=False),
+        "Link": html.escape(r.get("Link") or r.get("AdvisoryURL") or r.get("URL") or ""),
+    }
+
+def read_high_risk_rows(path: Path) -> Tuple[List[Dict[str, str]], int]:
+    """Stream the CSV and keep only high-risk rows; also return the total row count."""
+    # csv.reader i.p.v. DictReader: alleen voor de (weinige) high-risk rijen een dict bouwen
+    high_risk, total = [], 0
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header or "Severity" not in header:
+            return [], sum(1 for rec in reader if rec)
+        sev_idx = header.index("Severity")
+        width = len(header)
+        for rec in reader:
+            if not rec:  # lege regels, net als DictReader
+                continue
+            total += 1
+            if len(rec) > sev_idx and is_high_risk(rec[sev_idx]):
+                if len(rec) < width:
+                    rec += [""] * (width - len(rec))
+                high_risk.append(dict(zip(header, rec)))
+    return high_risk, total
+
+def send_to_telegram(text: str) -> Tuple[bool, str]:
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        log("⚠️  Telegram niet geconfigureerd; skipping.")
+        return (False, "Telegram not configured")
+
+    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    payload = {
+        "chat_id": TELEGRAM_CHAT_ID,
+        "text": text,
+        "parse_mode": "HTML",
+        "disable_web_page_preview": False,
+    }
+    r = TELEGRAM_SESSION.post(url, json=payload, timeout=20)
+    if r.status_code != 200:
+        return (False, f"Telegram error {r.status_code}: {r.text}")
+    return (True, "ok")
+
+def build_urgent_message(rows: List[Dict[str, str]], header: str = URGENT_HEADER) -> str:
+    # hele regels toevoegen zolang ze passen: knippen in de samengevoegde string
+    # kan midden in een tag vallen ("<b") en dan weigert Telegram het bericht
+    parts, used = [header], len(header.encode("utf-8"))
+    for r in map(normalize_row, rows):
+        line = (LINE_TMPL_LINK if r["Link"] else LINE_TMPL).format_map(r)
+        cost = len(line.encode("utf-8")) + (len(parts) > 1)  # + "\n" tussen regels
+        if used + cost > MESSAGE_MAX_BYTES:
+            break
+        parts.append(line)
+        used += cost
+    return header + "\n".join(parts[1:])
@@ -1,29 +1,78 @@
 from __future__ import annotations
-import json, re, hashlib, time
+import json, os, re, hashlib, time
+from functools import lru_cache
 from pathlib import Path
 from typing import Iterable, Dict, Any, Tuple, List
 
+try:
+    import orjson  # sneller; valt terug op stdlib json
+except ImportError:
+    orjson = None
+
+# Gedeeld door de harvester- en Telegram-sessie (geen Telegram-import in de harvester)
+USER_AGENT = "ncsc-csaf-harvester (+https://github.com/koensmink/ncsc-csaf-harvester)"
+
 CACHE_PATH = Path("output/sent_cache.json")
 CACHE_TTL_DAYS = 30  # verwijder verouderde entries
+CACHE_GC_INTERVAL = 3600  # seconden tussen opruimrondes
+
+# In-process kopie van de cache; één keer lezen per run
+_cache: dict | None = None
 
 def _now_ts() -> int:
     return int(time.time())
 
+# JSON- en schrijfhelpers; ook gebruikt door harvest_ncsc
+def json_loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def json_dumps(obj: Any, indent: bool = True) -> bytes:
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _hash_hex(data: bytes, digest_size: int) -> str:
+    # geen security-doel: blake2b is sneller dan sha256 en levert direct de gewenste lengte
+    return hashlib.blake2b(data, digest_size=digest_size).hexdigest()
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    # temp + rename: een crash laat nooit een half geschreven bestand achter
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+@lru_cache(maxsize=8)
+def _hash_msg(message_text: str) -> str:
+    # is_same_message en mark_sent hashen hetzelfde bericht: één keer rekenen
+    return _hash_hex(message_text.encode("utf-8"), 16)
+
 def load_cache() -> dict:
     if CACHE_PATH.exists():
         try:
-            return json.loads(CACHE_PATH.read_text(encoding="utf-8"))
+            return json_loads(CACHE_PATH.read_bytes())
         except Exception:
             pass
     return {"advisory_ids": {}, "last_message_hash": None, "version": 1}
 
 def save_cache(cache: dict) -> None:
     CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    cutoff = _now_ts() - CACHE_TTL_DAYS * 86400
-    cache["advisory_ids"] = {
-        k: v for k, v in cache.get("advisory_ids", {}).items() if v >= cutoff
-    }
-    CACHE_PATH.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+    now = _now_ts()
+    # verlopen entries hooguit eens per uur opruimen; in-place i.p.v. dict opnieuw bouwen
+    if now - cache.get("last_gc", 0) >= CACHE_GC_INTERVAL:
+        cutoff = now - CACHE_TTL_DAYS * 86400
+        ids = cache.setdefault("advisory_ids", {})
+        for k in [k for k, v in ids.items() if v < cutoff]:
+            del ids[k]
+        cache["last_gc"] = now
+    atomic_write_bytes(CACHE_PATH, json_dumps(cache))
+
+def _get_cache() -> dict:
+    global _cache
+    if _cache is None:
+        _cache = load_cache()
+    return _cache
 
 # Herken een stabiele sleutel per advisory
 ID_RE = re.compile(r"(NCSC-\d{4}-\d{4})", re.IGNORECASE)
@@ -43,32 +92,33 @@ def advisory_key(row: Dict[str, Any]) -> str | None:
     sig = "|".join(str(row.get(k, "")).strip() for k in ("Title", "Description", "Vendor", "Product", "CVE", "URL"))
     if not sig:
         return None
-    return "HASH:" + hashlib.sha256(sig.encode("utf-8")).hexdigest()[:16]
+    return "HASH:" + _hash_hex(sig.encode("utf-8"), 8)
 
 def filter_new_advisories(rows: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
-    cache = load_cache()
-    seen = cache.get("advisory_ids", {})
+    cache = _get_cache()
+    is_seen = cache.get("advisory_ids", {}).__contains__
     new_rows, used_ids = [], []
+    add_new, add_used = new_rows.append, used_ids.append
     for r in rows:
         key = advisory_key(r)
         if not key:
-            new_rows.append(r)
+            add_new(r)
             continue
-        used_ids.append(key)
-        if key not in seen:
-            new_rows.append(r)
+        add_used(key)
+        if not is_seen(key):
+            add_new(r)
     return new_rows, used_ids
 
 def mark_sent(used_ids: List[str], message_text: str) -> None:
-    cache = load_cache()
+    cache = _get_cache()
     ts = _now_ts()
     for k in used_ids:
         if k:
             cache.setdefault("advisory_ids", {})[k] = ts
-    cache["last_message_hash"] = hashlib.sha256(message_text.encode("utf-8")).hexdigest()
+    cache["last_message_hash"] = _hash_msg(message_text)
+    cache.pop("last_batch", None)  # oude batch-short-circuit; verliep niet met de TTL
     save_cache(cache)
 
 def is_same_message(message_text: str) -> bool:
-    cache = load_cache()
-    h = hashlib.sha256(message_text.encode("utf-8")).hexdigest()
-    return cache.get("last_message_hash") == h
+    cache = _get_cache()
+    return cache.get("last_message_hash") == _hash_msg(message_text)
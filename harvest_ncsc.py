@@ -1,80 +1,228 @@
 #!/usr/bin/env python3
 import csv
-import json
+import hashlib
+import html
+import os
+import re
+import threading
+import time
 import datetime
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.parse import urljoin
-from bs4 import BeautifulSoup
+from typing import NamedTuple
+from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from zoneinfo import ZoneInfo
 from dateutil import parser as dtparser  # python-dateutil staat al in requirements
+from dedupe import ID_RE, USER_AGENT, atomic_write_bytes, json_dumps, json_loads
 
 # ------------------------------------------------------------
 # Config
 # ------------------------------------------------------------
-YEAR = datetime.datetime.utcnow().year
 BASE_ROOT = "https://advisories.ncsc.nl/"
-BASE_DIR = f"{BASE_ROOT}csaf/v2/{YEAR}/"
 
 OUTPUT_DIR = Path("output/daily")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 LAST_RUN_PATH = Path("output/last_run.json")
 
+# Lokale kopie van advisory-JSON; wordt via cached_get (ETag/Last-Modified) gerevalideerd
+CSAF_CACHE_DIR = Path("output/csaf_cache")
+CSAF_CACHE_MAX_ENTRIES = 2000
+
+# ETag/Last-Modified per URL (conditional GET); bodies van o.a. de listing staan ernaast
+HTTP_CACHE_DIR = Path("output/http_cache")
+HTTP_CACHE_INDEX = HTTP_CACHE_DIR / "index.json"
+
+# <a href="...json"> in de directory listing
+HREF_JSON_RE = re.compile(r"""href=["']([^"']+?\.json)["']""", re.IGNORECASE)
+
+
+class AdvisoryRow(NamedTuple):
+    """One line of the daily CSV, in column order."""
+    AdvisoryID: str
+    Version: str
+    Severity: str
+    Description: str
+    Link: str
+
+
+CSV_FIELDS = AdvisoryRow._fields
+
+# kans/schade -> korte letter voor [K/S]
+SEVERITY_SHORT = {
+    "low": "L",
+    "medium": "M",
+    "high": "H",
+    "critical": "H",
+}
+
 LOCAL_TZ = ZoneInfo("Europe/Amsterdam")
 
+# Parallelle downloads: één gedeelde Session zodat TLS-verbindingen hergebruikt worden.
+# De pool is even groot als het aantal workers; zo begrenst MAX_WORKERS ook het
+# aantal gelijktijdige requests naar advisories.ncsc.nl.
+MAX_WORKERS = max(1, int(os.getenv("HARVEST_WORKERS", "24")))
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": USER_AGENT})
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=MAX_WORKERS,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+
 
 # ------------------------------------------------------------
 # Helpers
 # ------------------------------------------------------------
-def save_last_run(csv_path: str, count: int) -> None:
+def save_last_run(csv_path: str, count: int, run_at: datetime.datetime) -> None:
     data = {
-        "last_run_at": datetime.datetime.utcnow().isoformat(),
+        # zelfde formaat als voorheen: naïeve UTC-tijd
+        "last_run_at": run_at.astimezone(datetime.timezone.utc).replace(tzinfo=None).isoformat(),
         "todays_count": count,
         "csv_path": csv_path,
     }
-    LAST_RUN_PATH.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    atomic_write_bytes(LAST_RUN_PATH, json_dumps(data))
+
+
+def prune_csaf_cache(max_entries: int = CSAF_CACHE_MAX_ENTRIES) -> None:
+    """Drop least recently used cache files above max_entries."""
+    # scandir: is_file() komt uit d_type, dus alleen stat() als er echt gesnoeid moet worden
+    with os.scandir(CSAF_CACHE_DIR) as entries:
+        files = [e for e in entries if e.name.endswith(".json") and e.is_file()]
+    if len(files) <= max_entries:
+        return
+    by_age = sorted((e.stat().st_mtime, e.path) for e in files)
+    for _, path in by_age[: len(files) - max_entries]:
+        Path(path).unlink(missing_ok=True)
+
+
+_http_cache: dict | None = None
+_http_cache_lock = threading.Lock()
+
+
+def _get_http_cache() -> dict:
+    global _http_cache
+    with _http_cache_lock:
+        if _http_cache is None:
+            try:
+                _http_cache = json_loads(HTTP_CACHE_INDEX.read_bytes())
+            except Exception:
+                _http_cache = {}
+        return _http_cache
+
+
+def save_http_cache() -> None:
+    if _http_cache is None:
+        return
+    HTTP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # compact: de index wordt niet gecommit en door niemand met de hand gelezen
+    with _http_cache_lock:
+        payload = json_dumps(_http_cache, indent=False)
+    atomic_write_bytes(HTTP_CACHE_INDEX, payload)
+
+
+def _fresh_until(headers) -> float | None:
+    """Absolute expiry from Cache-Control max-age minus Age; None when not cacheable."""
+    directives = [d.strip().lower() for d in (headers.get("Cache-Control") or "").split(",")]
+    if "no-cache" in directives or "no-store" in directives:
+        return None
+    for d in directives:
+        if d.startswith("max-age="):
+            try:
+                max_age = int(d[len("max-age="):])
+                # Age: tijd die het antwoord al in een tussenliggende cache stond
+                age = int(headers.get("Age") or 0)
+            except ValueError:
+                return None
+            now = time.time()
+            return max(now, now + max_age - age)
+    return None
+
+
+def cached_get(url: str, body_path: Path | None = None, conditional: bool = True) -> bytes:
+    """
+    GET with If-None-Match/If-Modified-Since from the previous response.
+    Bij 304 komt de body van body_path (standaard onder output/http_cache/);
+    binnen de Cache-Control max-age wordt helemaal geen request gedaan.
+    """
+    if body_path is None:
+        name = hashlib.blake2b(url.encode("utf-8"), digest_size=8).hexdigest()
+        body_path = HTTP_CACHE_DIR / f"{name}.body"
+
+    index = _get_http_cache()
+    entry = index.get(url) or {}
+
+    headers = {}
+    if conditional and body_path.exists():
+        if (entry.get("fresh_until") or 0) > time.time():
+            os.utime(body_path)  # LRU: recent gebruikt
+            return body_path.read_bytes()
+        # alleen validators van de server zelf; de mtime zegt niets (LRU-touch)
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    r = SESSION.get(url, headers=headers, timeout=20)
+    if r.status_code == 304 and headers:
+        with _http_cache_lock:
+            entry["fresh_until"] = _fresh_until(r.headers)
+            index[url] = entry
+        os.utime(body_path)  # LRU: recent gebruikt
+        return body_path.read_bytes()
+    r.raise_for_status()
 
+    body_path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_bytes(body_path, r.content)
+    with _http_cache_lock:
+        index[url] = {
+            "etag": r.headers.get("ETag"),
+            # zonder Last-Modified: Date van het antwoord (serverklok) als validator
+            "last_modified": r.headers.get("Last-Modified") or r.headers.get("Date"),
+            "fresh_until": _fresh_until(r.headers),
+        }
+    return r.content
 
-def fetch_directory_listing() -> list[str]:
-    """Return list of JSON filenames from index HTML."""
-    print(f"🔎 Gebruik directory listing: {BASE_DIR}")
 
-    r = requests.get(BASE_DIR, timeout=20)
-    r.raise_for_status()
+def _year_dir(year: int) -> str:
+    """CSAF directory for one publication year."""
+    return f"{BASE_ROOT}csaf/v2/{year}/"
+
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    links = soup.find_all("a")
+def fetch_directory_listing(base_dir: str) -> list[str]:
+    """Return list of advisory JSON filenames (ncsc-YYYY-NNNN.json) from index HTML."""
+    print(f"🔎 Gebruik directory listing: {base_dir}")
 
-    json_files = []
-    for a in links:
-        href = a.get("href")
-        if not href:
-            continue
-        if href.lower().endswith(".json"):
-            json_files.append(href)
+    listing = cached_get(base_dir).decode("utf-8", errors="replace")
 
-    return json_files
+    # andere .json-bestanden in de listing zijn geen advisories: niet downloaden
+    hrefs = (html.unescape(href) for href in HREF_JSON_RE.findall(listing))
+    return [href for href in hrefs if _advisory_id_from_url(href)]
 
 
 def _extract_note_text(notes: list[dict], title: str) -> str:
     """Find note by title and return its text."""
+    wanted = title.lower()
     for n in notes or []:
-        if (n.get("title") or "").strip().lower() == title.lower():
+        if (n.get("title") or "").strip().lower() == wanted:
             return (n.get("text") or "").strip().lower()
     return ""
 
 
 def _severity_from_kans_schade(kans: str, schade: str) -> str:
     """Map kans/schade to [H/H], [M/H], etc."""
-    map_short = {
-        "low": "L",
-        "medium": "M",
-        "high": "H",
-        "critical": "H",
-    }
-    k = map_short.get(kans, "")
-    s = map_short.get(schade, "")
+    k = SEVERITY_SHORT.get(kans, "")
+    s = SEVERITY_SHORT.get(schade, "")
     if k and s:
         return f"[{k}/{s}]"
     return ""
@@ -99,7 +247,8 @@ def _format_version(v: str) -> str:
 def _get_release_dt(json_data: dict) -> datetime.datetime | None:
     """
     Returns current_release_date or initial_release_date as aware datetime.
-    CSAF gebruikt RFC3339/ISO8601; dateutil kan dit robuust parsen.
+    CSAF gebruikt RFC3339/ISO8601; fromisoformat (3.11+) dekt het gangbare formaat,
+    dateutil vangt de rest robuust op.
     """
     doc = json_data.get("document", {})
     tracking = doc.get("tracking", {})
@@ -108,7 +257,10 @@ def _get_release_dt(json_data: dict) -> datetime.datetime | None:
         return None
 
     try:
-        dt = dtparser.isoparse(date_str)
+        try:
+            dt = datetime.datetime.fromisoformat(date_str)
+        except ValueError:
+            dt = dtparser.isoparse(date_str)
         if dt.tzinfo is None:
             # als er geen tz in staat, interpreteer als UTC
             dt = dt.replace(tzinfo=datetime.timezone.utc)
@@ -117,7 +269,7 @@ def _get_release_dt(json_data: dict) -> datetime.datetime | None:
         return None
 
 
-def normalize_advisory(json_data: dict) -> dict:
+def normalize_advisory(json_data: dict) -> AdvisoryRow:
     """Extract normalized advisory fields from CSAF JSON."""
     doc = json_data.get("document", {})
     tracking = doc.get("tracking", {})
@@ -132,76 +284,126 @@ def normalize_advisory(json_data: dict) -> dict:
 
     title = (doc.get("title") or "").strip()
 
-    return {
-        "AdvisoryID": advisory_id,
-        "Version": _format_version(version_raw),
-        "Severity": severity,
-        "Description": title,
-        "Link": f"{BASE_ROOT}advisory?id={advisory_id}" if advisory_id else "",
-    }
+    return AdvisoryRow(
+        AdvisoryID=advisory_id,
+        Version=_format_version(version_raw),
+        Severity=severity,
+        Description=title,
+        Link=f"{BASE_ROOT}advisory?id={advisory_id}" if advisory_id else "",
+    )
+
+
+def _advisory_url(href: str, base_dir: str) -> str:
+    """Build absolute advisory URL from a listing href."""
+    if href.startswith(("http://", "https://")):
+        return href
+    if href.startswith("csaf/"):
+        return urljoin(BASE_ROOT, href.lstrip("/"))
+    return urljoin(base_dir, href)
+
+
+def _advisory_id_from_url(advisory_url: str) -> str | None:
+    """Guess NCSC-YYYY-NNNN from the filename, before any download."""
+    name = Path(urlparse(advisory_url).path).name
+    # snelle route voor de vaste vorm ncsc-YYYY-NNNN.json; anders regex
+    stem = name[:-5]
+    if (
+        len(stem) == 14
+        and stem[:5].upper() == "NCSC-"
+        and stem[9] == "-"
+        and stem[5:9].isdigit()
+        and stem[10:].isdigit()
+    ):
+        return stem.upper()
+    m = ID_RE.search(name)
+    return m.group(1).upper() if m else None
+
+
+def fetch_one(advisory_url: str) -> dict | None:
+    """
+    Download and parse one advisory JSON; None on failure.
+    Een bestaande cache-kopie wordt altijd gerevalideerd: NCSC werkt advisories
+    in-place bij (nieuwe tracking.version onder dezelfde bestandsnaam).
+    """
+    cache_path = CSAF_CACHE_DIR / Path(urlparse(advisory_url).path).name
+    try:
+        try:
+            return json_loads(cached_get(advisory_url, cache_path))
+        except ValueError:
+            # kapotte cache-kopie: onvoorwaardelijk opnieuw ophalen
+            return json_loads(cached_get(advisory_url, cache_path, conditional=False))
+    except requests.HTTPError as e:
+        print(f"⚠️ Skip {advisory_url}: {e.response.status_code}")
+        return None
+    except Exception as e:
+        print(f"⚠️ Error tijdens ophalen {advisory_url}: {e}")
+        return None
 
 
 # ------------------------------------------------------------
 # Main harvest logic
 # ------------------------------------------------------------
 def main():
-    # "vandaag" in Europe/Amsterdam
-    today_local = datetime.datetime.now(LOCAL_TZ).date()
+    # "vandaag" in Europe/Amsterdam; ook het jaar van de listing komt hieruit
+    # (niet uit UTC bij import: rond de jaarwisseling zou dat de vorige map zijn)
+    now_local = datetime.datetime.now(LOCAL_TZ)
+    today_local = now_local.date()
+    base_dir = _year_dir(today_local.year)
     out_csv = OUTPUT_DIR / f"{today_local.isoformat()}.csv"
 
-    json_files = fetch_directory_listing()
-    print(f"📄 {len(json_files)} JSON-bestanden gevonden.")
-
-    rows = []
-    skipped_not_today = 0
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    CSAF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    prune_csaf_cache()
 
-    for href in json_files:
-        # URL opbouw
-        if href.startswith("http://") or href.startswith("https://"):
-            advisory_url = href
-        elif href.startswith("csaf/"):
-            advisory_url = urljoin(BASE_ROOT, href.lstrip("/"))
-        else:
-            advisory_url = urljoin(BASE_DIR, href)
+    json_files = fetch_directory_listing(base_dir)
+    print(f"📄 {len(json_files)} JSON-bestanden gevonden.")
 
-        try:
-            r = requests.get(advisory_url, timeout=20)
-            if r.status_code != 200:
-                print(f"⚠️ Skip {advisory_url}: {r.status_code}")
-                continue
+    urls = [_advisory_url(href, base_dir) for href in json_files]
 
-            data = r.json()
+    count = 0
+    skipped_not_today = 0
 
-            release_dt = _get_release_dt(data)
-            if release_dt is None:
-                # als release-datum ontbreekt: overslaan (of kies hier ander gedrag)
-                skipped_not_today += 1
+    # Rijen direct wegschrijven zodra ze binnenkomen (geen lijst in geheugen).
+    # Eerst naar .tmp en daarna os.replace: notify ziet nooit een half bestand.
+    tmp_csv = out_csv.with_suffix(".csv.tmp")
+    with open(tmp_csv, "w", newline="", encoding="utf-8") as f, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        writerow = writer.writerow
+
+        for url, data in zip(urls, ex.map(fetch_one, urls)):
+            if data is None:
                 continue
 
-            release_local_date = release_dt.astimezone(LOCAL_TZ).date()
-            if release_local_date != today_local:
-                skipped_not_today += 1
+            # één afwijkend document (bv. "document": null) mag de run niet afbreken
+            try:
+                release_dt = _get_release_dt(data)
+                if release_dt is None:
+                    # als release-datum ontbreekt: overslaan (of kies hier ander gedrag)
+                    skipped_not_today += 1
+                    continue
+
+                release_local_date = release_dt.astimezone(LOCAL_TZ).date()
+                if release_local_date != today_local:
+                    skipped_not_today += 1
+                    continue
+
+                row = normalize_advisory(data)
+            except Exception as e:
+                print(f"⚠️ Error tijdens verwerken {url}: {e}")
                 continue
 
-            normalized = normalize_advisory(data)
-            if normalized["AdvisoryID"] or normalized["Description"]:
-                rows.append(normalized)
-
-        except Exception as e:
-            print(f"⚠️ Error tijdens ophalen {advisory_url}: {e}")
-            continue
-
-    # CSV schrijven
-    fieldnames = ["AdvisoryID", "Version", "Severity", "Description", "Link"]
+            if row.AdvisoryID or row.Description:
+                writerow(row)
+                count += 1
 
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    os.replace(tmp_csv, out_csv)
 
-    save_last_run(str(out_csv), len(rows))
+    save_last_run(str(out_csv), count, now_local)
+    save_http_cache()
 
-    print(f"✅ {len(rows)} advisories van vandaag geschreven naar {out_csv}")
+    print(f"✅ {count} advisories van vandaag geschreven naar {out_csv}")
     print(f"ℹ️ Overgeslagen (niet van vandaag / geen datum): {skipped_not_today}")
     return 0
 